@@ -1,25 +1,134 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from cachetools import TTLCache
+import bcrypt
+import jwt
+from jwt.exceptions import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import make_transient_to_detached
 from database import User, get_db
 
 SECRET_KEY = "your-secret-key-change-this-in-production-use-env-variable"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt_sha256 prehashes so passwords over 72 bytes are not truncated; plain
+# bcrypt stays listed so existing hashes still verify
+pwd_context = CryptContext(
+    schemes=["bcrypt_sha256", "bcrypt"],
+    bcrypt_sha256__rounds=10,
+    deprecated="auto"
+)
+# Default handler resolved once so hashing skips CryptContext's scheme dispatch
+_hash_handler = pwd_context.handler()
+_BCRYPT_SHA256_PREFIX = "$bcrypt-sha256$"
+# Acceptable range for a single password verify on the deploy machine
+PASSWORD_VERIFY_TARGET_MS = (20, 250)
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Per-request user lookup, built once at import
+USER_BY_ID_STMT = select(User).filter(User.id == bindparam("user_id"))
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# bcrypt runs in worker processes so a login never blocks the event loop.
+# Workers start lazily, after the event loop and aiosqlite threads exist, so
+# they must not be forked from this process; forkserver (or spawn where it is
+# unavailable) starts them from a clean single-threaded one.
+_bcrypt_pool = ProcessPoolExecutor(
+    max_workers=os.cpu_count(),
+    mp_context=multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+)
+
+logger = logging.getLogger(__name__)
+
+# Short-lived cache of bcrypt results keyed by sha256(plain|hashed), so repeat
+# logins skip the expensive hash. Keying on the stored hash means a password
+# change never hits a stale entry.
+_verify_cache = TTLCache(maxsize=1024, ttl=60)
+
+def _verify_uncached(plain_password: str, hashed_password: str) -> bool:
+    if hashed_password.startswith(_BCRYPT_SHA256_PREFIX):
+        return _hash_handler.verify(plain_password, hashed_password)
+    # Legacy plain bcrypt hashes go straight to the bcrypt library
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+def _hash_password(password: str) -> str:
+    return _hash_handler.hash(password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    key = hashlib.sha256(plain_password.encode() + b"|" + hashed_password.encode()).digest()
+    cached = _verify_cache.get(key)
+    if cached is not None:
+        return cached
+    verified = await asyncio.get_running_loop().run_in_executor(
+        _bcrypt_pool, _verify_uncached, plain_password, hashed_password
+    )
+    _verify_cache[key] = verified
+    return verified
+
+async def get_password_hash(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(
+        _bcrypt_pool, _hash_password, password
+    )
+
+def shutdown_password_pool():
+    _bcrypt_pool.shutdown(wait=False, cancel_futures=True)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+def check_password_hash_cost() -> float:
+    """Time one verify at the configured cost and warn if it is out of range"""
+    sample_hash = _hash_password("calibration-password")
+    start = time.perf_counter()
+    _verify_uncached("calibration-password", sample_hash)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    low, high = PASSWORD_VERIFY_TARGET_MS
+    if elapsed_ms < low or elapsed_ms > high:
+        logger.warning(
+            f"Password verify took {elapsed_ms:.0f}ms, outside the {low}-{high}ms target; "
+            f"adjust bcrypt_sha256__rounds"
+        )
+    else:
+        logger.info(f"Password verify takes {elapsed_ms:.0f}ms")
+    return elapsed_ms
+
+# Resolved users keyed by raw bearer token, so repeat requests skip the JWT
+# decode and the user lookup. Entries hold (column values, exp) rather than
+# the User itself: a live instance belongs to the request that loaded it and
+# is expired if that request rolls back. Entries are dropped once the token
+# itself expires.
+_user_cache = TTLCache(maxsize=4096, ttl=30)
+_USER_COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+def _cache_user(token: str, user: User, exp: float):
+    _user_cache[token] = ({key: getattr(user, key) for key in _USER_COLUMNS}, exp)
+
+def _get_cached_user(token: str) -> Optional[User]:
+    """Return a fresh detached User for a cached token, or None"""
+    entry = _user_cache.get(token)
+    if entry is None:
+        return None
+    values, exp = entry
+    if exp <= time.time():
+        _user_cache.pop(token, None)
+        return None
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -40,24 +149,31 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    print(" credentials:", credentials)
+    token = credentials.credentials
+    user = _get_cached_user(token)
+    if user is not None:
+        # Attach to this session without a SELECT so relationships that
+        # resolve to the user still come from the identity map
+        return await db.merge(user, load=False)
+    
     try:
-        token = credentials.credentials
-        print("token:", credentials)
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print("Decoded payload:", payload)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Decoded token payload: {payload}")
         user_id: int = int(payload.get("sub"))
         if user_id is None:
             raise credentials_exception
     except JWTError as e:
-        print("JWTError:", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"JWT validation failed: {e}")
         raise credentials_exception
     
-    result = await db.execute(select(User).filter(User.id == user_id))
+    result = await db.execute(USER_BY_ID_STMT, {"user_id": user_id})
     user = result.scalar_one_or_none()
     
     if user is None:
         raise credentials_exception
+    _cache_user(token, user, payload["exp"])
     return user
 
 async def get_current_user_optional(
@@ -66,8 +182,14 @@ async def get_current_user_optional(
 ) -> Optional[User]:
     if credentials is None:
         return None
+    token = credentials.credentials
+    user = _get_cached_user(token)
+    if user is not None:
+        # Attach to this session without a SELECT so relationships that
+        # resolve to the user still come from the identity map
+        return await db.merge(user, load=False)
+    
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("sub")
         if user_id is None:
@@ -75,6 +197,8 @@ async def get_current_user_optional(
     except JWTError:
         return None
     
-    result = await db.execute(select(User).filter(User.id == user_id))
+    result = await db.execute(USER_BY_ID_STMT, {"user_id": user_id})
     user = result.scalar_one_or_none()
+    if user is not None:
+        _cache_user(token, user, payload["exp"])
     return user
\ No newline at end of file
@@ -1,23 +1,39 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, delete
+from sqlalchemy import select, func, and_, or_, delete, update, bindparam, literal, Integer
 from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import List, Optional, Tuple
 from database import User, Poll, PollOption, Vote, Like
 from schemas import PollCreate, PollUpdate, VoteCreate
-from auth import get_password_hash
+from auth import get_password_hash, USER_BY_ID_STMT
 import math
 
+# Hot statements built once at import; callers pass values as bind parameters
+USER_BY_USERNAME_STMT = select(User).filter(User.username == bindparam("username"))
+POLL_EXISTS_STMT = select(Poll.id).filter(Poll.id == bindparam("poll_id"))
+USER_LIKE_STMT = select(Like.id).filter(
+    and_(Like.poll_id == bindparam("poll_id"), Like.user_id == bindparam("user_id"))
+)
+# Polls only need the creator's username; skip the rest of the user row,
+# including the password hash
+CREATOR_LOAD = selectinload(Poll.creator).load_only(User.id, User.username)
+
 # User CRUD
 async def create_user(db: AsyncSession, username: str, email: str, password: str) -> User:
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash(password)
     user = User(username=username, email=email, hashed_password=hashed_password)
     db.add(user)
     await db.commit()
     await db.refresh(user)
     return user
 
+async def update_user_password(db: AsyncSession, user: User, password: str) -> User:
+    user.hashed_password = await get_password_hash(password)
+    await db.commit()
+    return user
+
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
-    result = await db.execute(select(User).filter(User.username == username))
+    result = await db.execute(USER_BY_USERNAME_STMT, {"username": username})
     return result.scalar_one_or_none()
 
 async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
@@ -25,7 +41,7 @@ async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     return result.scalar_one_or_none()
 
 async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
-    result = await db.execute(select(User).filter(User.id == user_id))
+    result = await db.execute(USER_BY_ID_STMT, {"user_id": user_id})
     return result.scalar_one_or_none()
 
 # Poll CRUD
@@ -54,25 +70,45 @@ async def create_poll(db: AsyncSession, poll_data: PollCreate, creator_id: int)
     poll = result.scalar_one()
     return poll
 
-async def get_poll_by_id(db: AsyncSession, poll_id: int) -> Optional[Poll]:
+async def get_poll_by_id(db: AsyncSession, poll_id: int, cache: Optional[dict] = None) -> Optional[Poll]:
+    if cache is not None and ("poll", poll_id) in cache:
+        return cache[("poll", poll_id)]
     result = await db.execute(
         select(Poll)
-        .options(selectinload(Poll.options), selectinload(Poll.creator))
+        .options(selectinload(Poll.options), CREATOR_LOAD)
         .filter(Poll.id == poll_id)
     )
-    return result.scalar_one_or_none()
+    poll = result.scalar_one_or_none()
+    if cache is not None:
+        cache[("poll", poll_id)] = poll
+    return poll
 
 async def get_polls(
     db: AsyncSession, 
     skip: int = 0, 
     limit: int = 20,
     creator_id: Optional[int] = None,
-    is_active: Optional[bool] = None
-) -> Tuple[List[Poll], int]:
+    is_active: Optional[bool] = None,
+    user_id: Optional[int] = None
+) -> Tuple[List[Tuple[Poll, Optional[int], bool]], int]:
+    """Returns ([(poll, user_vote_option_id, user_liked)], total)
+
+    The per-user flags come from outer joins on the same query; they are
+    None/False when no user_id is given.
+    """
     query = select(Poll).options(
         selectinload(Poll.options),
-        selectinload(Poll.creator)
+        CREATOR_LOAD
     )
+    if user_id is not None:
+        query = (
+            query
+            .outerjoin(Vote, and_(Vote.poll_id == Poll.id, Vote.user_id == user_id))
+            .outerjoin(Like, and_(Like.poll_id == Poll.id, Like.user_id == user_id))
+            .add_columns(Vote.option_id, Like.id.isnot(None))
+        )
+    else:
+        query = query.add_columns(literal(None, Integer), literal(False))
     
     filters = []
     if creator_id is not None:
@@ -83,6 +119,17 @@ async def get_polls(
     if filters:
         query = query.filter(and_(*filters))
     
+    query = query.order_by(Poll.created_at.desc()).offset(skip).limit(limit)
+    result = await db.execute(query)
+    polls = [
+        (poll, user_vote_option_id, bool(user_liked))
+        for poll, user_vote_option_id, user_liked in result.all()
+    ]
+    
+    # A partial page is the last one, so the total follows without a COUNT
+    if len(polls) < limit and (polls or skip == 0):
+        return polls, skip + len(polls)
+    
     count_query = select(func.count()).select_from(Poll)
     if filters:
         count_query = count_query.filter(and_(*filters))
@@ -90,78 +137,110 @@ async def get_polls(
     total_result = await db.execute(count_query)
     total = total_result.scalar()
     
-    query = query.order_by(Poll.created_at.desc()).offset(skip).limit(limit)
-    result = await db.execute(query)
-    polls = result.scalars().all()
-    
-    return list(polls), total
+    return polls, total
 
-async def update_poll(db: AsyncSession, poll_id: int, poll_update: PollUpdate) -> Optional[Poll]:
-    poll = await get_poll_by_id(db, poll_id)
-    if not poll:
-        return None
-    
-    if poll_update.title is not None:
-        poll.title = poll_update.title
-    if poll_update.description is not None:
-        poll.description = poll_update.description
-    if poll_update.is_active is not None:
-        poll.is_active = poll_update.is_active
+async def update_poll(
+    db: AsyncSession,
+    poll_id: int,
+    poll_update: PollUpdate,
+    cache: Optional[dict] = None
+) -> Optional[Poll]:
+    values = poll_update.model_dump(exclude_none=True)
+    if values:
+        result = await db.execute(
+            update(Poll)
+            .where(Poll.id == poll_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            return None
+        await db.commit()
     
-    await db.commit()
-    await db.refresh(poll)
+    # Reload once, overwriting any stale copy already in the session
     result = await db.execute(
-    select(Poll).options(selectinload(Poll.options)).filter(Poll.id == poll.id)
+        select(Poll)
+        .options(selectinload(Poll.options), CREATOR_LOAD)
+        .filter(Poll.id == poll_id)
+        .execution_options(populate_existing=True)
     )
-    poll = result.scalar_one()
+    poll = result.scalar_one_or_none()
+    if cache is not None:
+        cache[("poll", poll_id)] = poll
     return poll
 
-async def delete_poll(db: AsyncSession, poll_id: int) -> bool:
-    poll = await get_poll_by_id(db, poll_id)
+async def delete_poll(db: AsyncSession, poll_id: int, cache: Optional[dict] = None) -> bool:
+    poll = await get_poll_by_id(db, poll_id, cache)
     if not poll:
         return False
     
     await db.delete(poll)
     await db.commit()
+    if cache is not None:
+        cache.pop(("poll", poll_id), None)
     return True
 
 # Vote CRUD
 async def create_vote(db: AsyncSession, poll_id: int, option_id: int, user_id: int) -> Optional[Vote]:
-    # Check if poll exists and is active
-    poll = await get_poll_by_id(db, poll_id)
-    if not poll or not poll.is_active:
-        return None
+    # Take the user's previous vote, if any, off its option's count; undone
+    # by the rollback below if the vote turns out to be invalid
+    previous_option = (
+        select(Vote.option_id)
+        .filter(and_(Vote.poll_id == poll_id, Vote.user_id == user_id))
+        .scalar_subquery()
+    )
+    released = await db.execute(
+        update(PollOption)
+        .where(PollOption.id == previous_option)
+        .values(vote_count=PollOption.vote_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    is_new_vote = released.rowcount == 0
     
-    # Check if option belongs to poll
-    option_result = await db.execute(
-        select(PollOption).filter(
-            and_(PollOption.id == option_id, PollOption.poll_id == poll_id)
+    # Insert the vote, or move the user's existing vote to the new option.
+    # The SELECT only yields a row when the option belongs to the poll and
+    # the poll is active, so validation happens in the same statement.
+    valid_option = (
+        select(literal(user_id), literal(poll_id), PollOption.id)
+        .join(Poll, Poll.id == PollOption.poll_id)
+        .filter(
+            and_(
+                PollOption.id == option_id,
+                PollOption.poll_id == poll_id,
+                Poll.is_active == True
+            )
         )
     )
-    option = option_result.scalar_one_or_none()
-    if not option:
-        return None
-    
-    # Check if user already voted
-    existing_vote = await db.execute(
-        select(Vote).filter(
-            and_(Vote.poll_id == poll_id, Vote.user_id == user_id)
+    result = await db.execute(
+        sqlite_insert(Vote)
+        .from_select(["user_id", "poll_id", "option_id"], valid_option)
+        .on_conflict_do_update(
+            index_elements=[Vote.poll_id, Vote.user_id],
+            set_={"option_id": option_id}
         )
+        .returning(Vote)
+        .execution_options(populate_existing=True)
     )
-    existing = existing_vote.scalar_one_or_none()
-    
-    if existing:
-        # Update existing vote
-        existing.option_id = option_id
-        await db.commit()
-        await db.refresh(existing)
-        return existing
+    vote = result.scalar_one_or_none()
+    if vote is None:
+        await db.rollback()
+        return None
     
-    # Create new vote
-    vote = Vote(user_id=user_id, poll_id=poll_id, option_id=option_id)
-    db.add(vote)
+    # Keep the denormalized counters in step within the same transaction
+    await db.execute(
+        update(PollOption)
+        .where(PollOption.id == option_id)
+        .values(vote_count=PollOption.vote_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if is_new_vote:
+        await db.execute(
+            update(Poll)
+            .where(Poll.id == poll_id)
+            .values(total_votes=Poll.total_votes + 1)
+            .execution_options(synchronize_session=False)
+        )
     await db.commit()
-    await db.refresh(vote)
     return vote
 
 async def get_user_vote(db: AsyncSession, poll_id: int, user_id: int) -> Optional[Vote]:
@@ -172,60 +251,48 @@ async def get_user_vote(db: AsyncSession, poll_id: int, user_id: int) -> Optiona
     )
     return result.scalar_one_or_none()
 
-async def get_vote_counts(db: AsyncSession, poll_id: int) -> dict:
+async def get_option_vote_counts(db: AsyncSession, poll_id: int) -> List[Tuple[int, str, int, int]]:
+    """Returns (option_id, text, position, vote_count) rows ordered by position"""
     result = await db.execute(
-        select(Vote.option_id, func.count(Vote.id).label('count'))
-        .filter(Vote.poll_id == poll_id)
-        .group_by(Vote.option_id)
+        select(PollOption.id, PollOption.text, PollOption.position, PollOption.vote_count)
+        .filter(PollOption.poll_id == poll_id)
+        .order_by(PollOption.position)
     )
-    return {option_id: count for option_id, count in result.all()}
+    return [tuple(row) for row in result.all()]
 
-# Like CRUD
 async def toggle_like(db: AsyncSession, poll_id: int, user_id: int) -> Tuple[bool, int]:
     """Returns (is_liked, total_likes)"""
-    # Check if poll exists
-    poll = await get_poll_by_id(db, poll_id)
-    if not poll:
+    # Check the poll exists without loading it, its options or its creator
+    exists = await db.execute(POLL_EXISTS_STMT, {"poll_id": poll_id})
+    if exists.scalar_one_or_none() is None:
         return False, 0
     
-    # Check if like exists
-    existing_like = await db.execute(
-        select(Like).filter(
-            and_(Like.poll_id == poll_id, Like.user_id == user_id)
-        )
+    # Remove the like if present, otherwise add it
+    removed = await db.execute(
+        delete(Like)
+        .where(and_(Like.poll_id == poll_id, Like.user_id == user_id))
+        .execution_options(synchronize_session=False)
     )
-    like = existing_like.scalar_one_or_none()
-    
-    if like:
-        # Unlike
-        await db.delete(like)
-        await db.commit()
+    if removed.rowcount:
         is_liked = False
     else:
-        # Like
-        new_like = Like(user_id=user_id, poll_id=poll_id)
-        db.add(new_like)
-        await db.commit()
+        db.add(Like(user_id=user_id, poll_id=poll_id))
+        await db.flush()
         is_liked = True
     
-    # Get total likes
+    # Update the like counter in the same transaction and read it back
     total_result = await db.execute(
-        select(func.count(Like.id)).filter(Like.poll_id == poll_id)
+        update(Poll)
+        .where(Poll.id == poll_id)
+        .values(total_likes=Poll.total_likes + (1 if is_liked else -1))
+        .returning(Poll.total_likes)
+        .execution_options(synchronize_session=False)
     )
-    total_likes = total_result.scalar()
+    total_likes = total_result.scalar_one()
+    await db.commit()
     
     return is_liked, total_likes
 
-async def get_like_count(db: AsyncSession, poll_id: int) -> int:
-    result = await db.execute(
-        select(func.count(Like.id)).filter(Like.poll_id == poll_id)
-    )
-    return result.scalar()
-
 async def is_poll_liked_by_user(db: AsyncSession, poll_id: int, user_id: int) -> bool:
-    result = await db.execute(
-        select(Like).filter(
-            and_(Like.poll_id == poll_id, Like.user_id == user_id)
-        )
-    )
+    result = await db.execute(USER_LIKE_STMT, {"poll_id": poll_id, "user_id": user_id})
     return result.scalar_one_or_none() is not None
\ No newline at end of file
@@ -1,14 +1,41 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from fastapi import Request
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index, event, inspect, text
 from sqlalchemy.orm import relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 
 DATABASE_URL = "sqlite+aiosqlite:///./quickpoll.db"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# aiosqlite defaults to NullPool for file databases, opening a connection per
+# session; pool them so connections and their PRAGMAs are reused
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    query_cache_size=1200,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=False
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a vote/like write is in progress
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+# autoflush is off; crud flushes explicitly where a read depends on pending rows
+async_session_maker = async_sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+)
 
 Base = declarative_base()
 
@@ -27,6 +54,10 @@ class User(Base):
 
 class Poll(Base):
     __tablename__ = "polls"
+    __table_args__ = (
+        # Serves the feed's is_active filter, created_at ordering and COUNT
+        Index("ix_polls_active_created", "is_active", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -34,6 +65,9 @@ class Poll(Base):
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Denormalized counters, kept in step with votes/likes by crud
+    total_votes = Column(Integer, nullable=False, default=0, server_default="0")
+    total_likes = Column(Integer, nullable=False, default=0, server_default="0")
     
     creator = relationship("User", back_populates="polls")
     options = relationship("PollOption", back_populates="poll", cascade="all, delete-orphan")
@@ -46,12 +80,17 @@ class PollOption(Base):
     poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False)
     text = Column(String, nullable=False)
     position = Column(Integer, nullable=False)
+    vote_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     poll = relationship("Poll", back_populates="options")
     votes = relationship("Vote", back_populates="option", cascade="all, delete-orphan")
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # One vote per user per poll; also the conflict target for vote upserts
+        Index("uq_vote_poll_user", "poll_id", "user_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -64,6 +103,10 @@ class Vote(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        # One like per user per poll; the poll_id prefix also serves like counts
+        Index("uq_like_poll_user", "poll_id", "user_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -73,13 +116,98 @@ class Like(Base):
     user = relationship("User", back_populates="likes")
     poll = relationship("Poll", back_populates="likes")
 
+# Counter columns added after the first release, as (table, column)
+_COUNTER_COLUMNS = [
+    ("polls", "total_votes"),
+    ("polls", "total_likes"),
+    ("poll_options", "vote_count"),
+]
+
+# Unique indexes added after the first release, as (table, index name). Older
+# databases may hold duplicate (poll_id, user_id) rows that would block them.
+_UNIQUE_VOTER_INDEXES = [
+    ("votes", "uq_vote_poll_user"),
+    ("likes", "uq_like_poll_user"),
+]
+
+def _remove_duplicate_rows(sync_conn) -> bool:
+    # Keep the first vote/like per user per poll so the unique indexes can be
+    # created; returns True if any rows were deleted
+    inspector = inspect(sync_conn)
+    removed = False
+    for table, index_name in _UNIQUE_VOTER_INDEXES:
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        if index_name in existing:
+            continue
+        result = sync_conn.execute(text(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY poll_id, user_id)"
+        ))
+        removed = removed or result.rowcount > 0
+    return removed
+
+def _add_counter_columns(sync_conn) -> bool:
+    # Add the counter columns to databases created before they existed;
+    # returns True if any were added and need backfilling
+    inspector = inspect(sync_conn)
+    added = False
+    for table, column in _COUNTER_COLUMNS:
+        existing = {col["name"] for col in inspector.get_columns(table)}
+        if column not in existing:
+            sync_conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+            ))
+            added = True
+    return added
+
+def _backfill_counters(sync_conn):
+    # Recompute the counter columns from the vote and like rows
+    sync_conn.execute(text(
+        "UPDATE polls SET "
+        "total_votes = (SELECT COUNT(*) FROM votes WHERE votes.poll_id = polls.id), "
+        "total_likes = (SELECT COUNT(*) FROM likes WHERE likes.poll_id = polls.id)"
+    ))
+    sync_conn.execute(text(
+        "UPDATE poll_options SET "
+        "vote_count = (SELECT COUNT(*) FROM votes WHERE votes.option_id = poll_options.id)"
+    ))
+
+# Indexes no longer declared that older databases may still carry
+_RETIRED_INDEXES = ["ix_vote_poll_option"]
+
+def _drop_retired_indexes(sync_conn):
+    # Vote counts are read from the counter columns now, so the GROUP BY this
+    # index served no longer runs; drop it to save the write on every vote
+    for name in _RETIRED_INDEXES:
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+def _create_missing_indexes(sync_conn):
+    # create_all skips tables that already exist, so add any indexes declared
+    # since the database was first created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+def _migrate(sync_conn):
+    Base.metadata.create_all(sync_conn)
+    removed = _remove_duplicate_rows(sync_conn)
+    added = _add_counter_columns(sync_conn)
+    if removed or added:
+        _backfill_counters(sync_conn)
+    _create_missing_indexes(sync_conn)
+    _drop_retired_indexes(sync_conn)
+
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate)
 
 async def get_db():
     async with async_session_maker() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+def get_objcache(request: Request) -> dict:
+    """Per-request cache of loaded ORM objects, keyed by (kind, id)"""
+    return request.state.__dict__.setdefault("objcache", {})
\ No newline at end of file
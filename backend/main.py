@@ -1,23 +1,28 @@
 from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import math
+import orjson
 from contextlib import asynccontextmanager
 
-from database import get_db, init_db, User
+from database import get_db, get_objcache, init_db, User
 from schemas import (
     UserCreate, UserLogin, UserResponse, Token,
     PollCreate, PollResponse, PollUpdate, PollListResponse,
-    VoteCreate, VoteResponse, PollOptionResponse
+    VoteCreate, VoteResponse, PollOptionResponse,
+    VoteUpdateData, LikeUpdateData
 )
 from auth import (
-    verify_password, create_access_token, 
+    verify_password, password_needs_rehash, check_password_hash_cost,
+    shutdown_password_pool, create_access_token,
     get_current_user, get_current_user_optional
 )
 import crud
 from websocket import (
-    manager, handle_websocket_message,
+    manager, handle_websocket_message, start_pubsub, stop_pubsub,
     broadcast_vote_update, broadcast_like_update,
     broadcast_poll_created, broadcast_poll_updated, broadcast_poll_deleted
 )
@@ -28,11 +33,19 @@ logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    check_password_hash_cost()
+    await start_pubsub()
     yield
     # Shutdown
-    pass
+    await stop_pubsub()
+    shutdown_password_pool()
 
-app = FastAPI(title="QuickPoll API", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="QuickPoll API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # CORS configuration
 app.add_middleware(
@@ -43,6 +56,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def model_response(model: BaseModel, status_code: int = status.HTTP_200_OK) -> Response:
+    """Serialize a response model with pydantic-core in one pass.
+
+    Returning a Response makes FastAPI skip re-validating and re-encoding
+    the model against the route's response_model, which stays for the docs.
+    """
+    return Response(
+        content=model.model_dump_json(),
+        media_type="application/json",
+        status_code=status_code
+    )
+
+def build_poll_response(
+    poll,
+    user_vote_option_id: Optional[int] = None,
+    user_liked: bool = False
+) -> PollResponse:
+    """Assemble a PollResponse from a loaded Poll without validation.
+
+    Every field comes from the database or from our own bookkeeping, so
+    model_construct only assigns them; serialization is unchanged.
+    """
+    options_response = [
+        PollOptionResponse.model_construct(
+            id=opt.id,
+            text=opt.text,
+            position=opt.position,
+            vote_count=opt.vote_count
+        )
+        for opt in sorted(poll.options, key=lambda x: x.position)
+    ]
+    
+    return PollResponse.model_construct(
+        id=poll.id,
+        title=poll.title,
+        description=poll.description,
+        creator_id=poll.creator_id,
+        creator_username=poll.creator.username,
+        created_at=poll.created_at,
+        is_active=poll.is_active,
+        options=options_response,
+        total_votes=poll.total_votes,
+        total_likes=poll.total_likes,
+        user_voted=user_vote_option_id is not None,
+        user_liked=user_liked,
+        user_vote_option_id=user_vote_option_id
+    )
+
 # Auth endpoints
 @app.post("/api/auth/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -75,13 +136,17 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     user = await crud.get_user_by_username(db, user_data.username)
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if not user or not await verify_password(user_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes stored under a deprecated scheme or cost
+    if password_needs_rehash(user.hashed_password):
+        await crud.update_user_password(db, user, user_data.password)
+    
     access_token = create_access_token(data={"sub": str(user.id)})
     
     return Token(
@@ -103,40 +168,17 @@ async def create_poll(
 ):
     poll = await crud.create_poll(db, poll_data, current_user.id)
     
-    # Get vote counts and prepare response
-    vote_counts = await crud.get_vote_counts(db, poll.id)
-    total_votes = sum(vote_counts.values())
-    total_likes = await crud.get_like_count(db, poll.id)
-    
-    options_response = [
-        PollOptionResponse(
-            id=opt.id,
-            text=opt.text,
-            position=opt.position,
-            vote_count=vote_counts.get(opt.id, 0)
-        )
-        for opt in sorted(poll.options, key=lambda x: x.position)
-    ]
-    
-    poll_response = PollResponse(
-        id=poll.id,
-        title=poll.title,
-        description=poll.description,
-        creator_id=poll.creator_id,
-        creator_username=poll.creator.username,
-        created_at=poll.created_at,
-        is_active=poll.is_active,
-        options=options_response,
-        total_votes=total_votes,
-        total_likes=total_likes,
-        user_voted=False,
-        user_liked=False
-    )
+    poll_response = build_poll_response(poll)
     
     # Broadcast poll creation
-    await broadcast_poll_created(poll_response.model_dump(mode='json'))
+    poll_json = poll_response.model_dump_json()
+    await broadcast_poll_created(poll_json.encode())
     
-    return poll_response
+    return Response(
+        content=poll_json,
+        media_type="application/json",
+        status_code=status.HTTP_201_CREATED
+    )
 
 @app.get("/api/polls", response_model=PollListResponse)
 async def get_polls(
@@ -153,60 +195,23 @@ async def get_polls(
     if is_active is None and creator_id is None:
         is_active = True
     
-    polls, total = await crud.get_polls(db, skip, page_size, creator_id, is_active)
-    
-    poll_responses = []
-    for poll in polls:
-        vote_counts = await crud.get_vote_counts(db, poll.id)
-        total_votes = sum(vote_counts.values())
-        total_likes = await crud.get_like_count(db, poll.id)
-        
-        user_voted = False
-        user_vote_option_id = None
-        user_liked = False
-        
-        if current_user:
-            user_vote = await crud.get_user_vote(db, poll.id, current_user.id)
-            if user_vote:
-                user_voted = True
-                user_vote_option_id = user_vote.option_id
-            user_liked = await crud.is_poll_liked_by_user(db, poll.id, current_user.id)
-        
-        options_response = [
-            PollOptionResponse(
-                id=opt.id,
-                text=opt.text,
-                position=opt.position,
-                vote_count=vote_counts.get(opt.id, 0)
-            )
-            for opt in sorted(poll.options, key=lambda x: x.position)
-        ]
-        
-        poll_responses.append(PollResponse(
-            id=poll.id,
-            title=poll.title,
-            description=poll.description,
-            creator_id=poll.creator_id,
-            creator_username=poll.creator.username,
-            created_at=poll.created_at,
-            is_active=poll.is_active,
-            options=options_response,
-            total_votes=total_votes,
-            total_likes=total_likes,
-            user_voted=user_voted,
-            user_liked=user_liked,
-            user_vote_option_id=user_vote_option_id
-        ))
+    user_id = current_user.id if current_user else None
+    polls, total = await crud.get_polls(db, skip, page_size, creator_id, is_active, user_id)
+    
+    poll_responses = [
+        build_poll_response(poll, user_vote_option_id, user_liked)
+        for poll, user_vote_option_id, user_liked in polls
+    ]
     
     total_pages = math.ceil(total / page_size)
     
-    return PollListResponse(
+    return model_response(PollListResponse.model_construct(
         polls=poll_responses,
         total=total,
         page=page,
         page_size=page_size,
         total_pages=total_pages
-    )
+    ))
 
 @app.get("/api/polls/{poll_id}", response_model=PollResponse)
 async def get_poll(
@@ -222,55 +227,26 @@ async def get_poll(
             detail="Poll not found"
         )
     
-    vote_counts = await crud.get_vote_counts(db, poll.id)
-    total_votes = sum(vote_counts.values())
-    total_likes = await crud.get_like_count(db, poll.id)
-    
-    user_voted = False
     user_vote_option_id = None
     user_liked = False
     
     if current_user:
         user_vote = await crud.get_user_vote(db, poll.id, current_user.id)
         if user_vote:
-            user_voted = True
             user_vote_option_id = user_vote.option_id
         user_liked = await crud.is_poll_liked_by_user(db, poll.id, current_user.id)
     
-    options_response = [
-        PollOptionResponse(
-            id=opt.id,
-            text=opt.text,
-            position=opt.position,
-            vote_count=vote_counts.get(opt.id, 0)
-        )
-        for opt in sorted(poll.options, key=lambda x: x.position)
-    ]
-    
-    return PollResponse(
-        id=poll.id,
-        title=poll.title,
-        description=poll.description,
-        creator_id=poll.creator_id,
-        creator_username=poll.creator.username,
-        created_at=poll.created_at,
-        is_active=poll.is_active,
-        options=options_response,
-        total_votes=total_votes,
-        total_likes=total_likes,
-        user_voted=user_voted,
-        user_liked=user_liked,
-        user_vote_option_id=user_vote_option_id
-    )
+    return model_response(build_poll_response(poll, user_vote_option_id, user_liked))
 
 @app.put("/api/polls/{poll_id}", response_model=PollResponse)
 async def update_poll(
     poll_id: int,
     poll_update: PollUpdate,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    objcache: dict = Depends(get_objcache)
 ):
-    poll = await crud.get_poll_by_id(db, poll_id)
+    poll = await crud.get_poll_by_id(db, poll_id, objcache)
     
     if not poll:
         raise HTTPException(
@@ -284,55 +260,28 @@ async def update_poll(
             detail="Not authorized to update this poll"
         )
     
-    updated_poll = await crud.update_poll(db, poll_id, poll_update)
-    
-    vote_counts = await crud.get_vote_counts(db, updated_poll.id)
-    total_votes = sum(vote_counts.values())
-    total_likes = await crud.get_like_count(db, updated_poll.id)
+    updated_poll = await crud.update_poll(db, poll_id, poll_update, objcache)
     
     user_vote = await crud.get_user_vote(db, updated_poll.id, current_user.id)
-    user_voted = user_vote is not None
     user_vote_option_id = user_vote.option_id if user_vote else None
     user_liked = await crud.is_poll_liked_by_user(db, updated_poll.id, current_user.id)
     
-    options_response = [
-        PollOptionResponse(
-            id=opt.id,
-            text=opt.text,
-            position=opt.position,
-            vote_count=vote_counts.get(opt.id, 0)
-        )
-        for opt in sorted(updated_poll.options, key=lambda x: x.position)
-    ]
-    
-    poll_response = PollResponse(
-        id=updated_poll.id,
-        title=updated_poll.title,
-        description=updated_poll.description,
-        creator_id=updated_poll.creator_id,
-        creator_username=updated_poll.creator.username,
-        created_at=updated_poll.created_at,
-        is_active=updated_poll.is_active,
-        options=options_response,
-        total_votes=total_votes,
-        total_likes=total_likes,
-        user_voted=user_voted,
-        user_liked=user_liked,
-        user_vote_option_id=user_vote_option_id
-    )
+    poll_response = build_poll_response(updated_poll, user_vote_option_id, user_liked)
     
     # Broadcast poll update to ALL users
-    await broadcast_poll_updated(poll_id, poll_response.model_dump(mode='json'))
+    poll_json = poll_response.model_dump_json()
+    await broadcast_poll_updated(poll_id, poll_json.encode())
     
-    return poll_response
+    return Response(content=poll_json, media_type="application/json")
 
 @app.delete("/api/polls/{poll_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_poll(
     poll_id: int,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    objcache: dict = Depends(get_objcache)
 ):
-    poll = await crud.get_poll_by_id(db, poll_id)
+    poll = await crud.get_poll_by_id(db, poll_id, objcache)
     
     if not poll:
         raise HTTPException(
@@ -349,7 +298,7 @@ async def delete_poll(
     # Broadcast BEFORE deleting
     await broadcast_poll_deleted(poll_id)
     
-    await crud.delete_poll(db, poll_id)
+    await crud.delete_poll(db, poll_id, objcache)
 
 # Vote endpoints
 @app.post("/api/polls/{poll_id}/vote", response_model=VoteResponse)
@@ -367,31 +316,25 @@ async def vote_on_poll(
             detail="Invalid poll or option, or poll is inactive"
         )
     
-    # Get updated vote counts
-    vote_counts = await crud.get_vote_counts(db, poll_id)
-    total_votes = sum(vote_counts.values())
-    
-    # Get poll options for the response
-    poll = await crud.get_poll_by_id(db, poll_id)
-    options_data = [
-        {
-            "id": opt.id,
-            "text": opt.text,
-            "position": opt.position,
-            "vote_count": vote_counts.get(opt.id, 0)
-        }
-        for opt in sorted(poll.options, key=lambda x: x.position)
+    # Get options with their updated vote counts
+    options = [
+        PollOptionResponse.model_construct(
+            id=opt_id,
+            text=text,
+            position=position,
+            vote_count=count
+        )
+        for opt_id, text, position, count in await crud.get_option_vote_counts(db, poll_id)
     ]
     
-    # Broadcast vote update
-    await broadcast_vote_update(poll_id, {
-        "total_votes": total_votes,
-        "options": options_data,
-        "user_id": current_user.id,
-        "user_vote_option_id": vote_data.option_id
-    })
+    # Broadcast vote update. Only the aggregates are sent, so identical
+    # states encode to identical payloads and repeats can be skipped.
+    await broadcast_vote_update(poll_id, VoteUpdateData.model_construct(
+        total_votes=sum(opt.vote_count for opt in options),
+        options=options
+    ))
     
-    return VoteResponse.model_validate(vote)
+    return model_response(VoteResponse.model_validate(vote))
 
 # Like endpoints
 @app.post("/api/polls/{poll_id}/like")
@@ -409,11 +352,9 @@ async def toggle_poll_like(
         )
     
     # Broadcast like update
-    await broadcast_like_update(poll_id, {
-        "total_likes": total_likes,
-        "is_liked": is_liked,
-        "user_id": current_user.id
-    })
+    await broadcast_like_update(poll_id, LikeUpdateData.model_construct(
+        total_likes=total_likes
+    ))
     
     return {
         "is_liked": is_liked,
@@ -426,7 +367,13 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            data = await websocket.receive_json()
+            # Read the raw frame and parse with orjson; it accepts both the
+            # text frames browsers send and binary frames
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message["code"], message.get("reason"))
+            raw = message.get("text")
+            data = orjson.loads(raw if raw is not None else message["bytes"])
             await handle_websocket_message(websocket, data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -440,4 +387,15 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # "auto" runs on uvloop when it is installed (see requirements.txt) and
+    # falls back to asyncio's default loop where it isn't, e.g. on Windows
+    uvicorn.run(
+        app, host="0.0.0.0", port=8000, loop="auto",
+        # Clients only send small subscribe/ping frames. Capping inbound size
+        # and queue depth, and skipping per-connection deflate state, keeps
+        # idle subscribers cheap. Running through the uvicorn CLI needs the
+        # matching flags; see the README.
+        ws_max_size=64 * 1024,
+        ws_max_queue=8,
+        ws_per_message_deflate=False,
+    )
\ No newline at end of file
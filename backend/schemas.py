@@ -1,17 +1,33 @@
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import datetime
-from typing import List, Optional
+from typing import Annotated, List, Literal, Optional, Union
+import re
+
+# Bounded single-pass check: one @, no whitespace, a dot in the domain
+_EMAIL_RE = re.compile(r'[^@\s]{1,64}@[^@\s]+\.[^@\s]+')
+# Letters, digits, _ and -; \w keeps the Unicode letters isalnum() accepted
+_USERNAME_RE = re.compile(r'\A[\w-]+\Z')
 
 class UserCreate(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
-    email: EmailStr
+    email: str = Field(..., max_length=254)
     password: str = Field(..., min_length=8)
     
-    @validator('username')
+    @field_validator('username')
+    @classmethod
     def username_alphanumeric(cls, v):
-        if not v.replace('_', '').replace('-', '').isalnum():
+        if not _USERNAME_RE.match(v):
             raise ValueError('Username must be alphanumeric (with _ or - allowed)')
         return v
+    
+    @field_validator('email')
+    @classmethod
+    def email_format(cls, v):
+        if not _EMAIL_RE.fullmatch(v):
+            raise ValueError('value is not a valid email address')
+        # Domains are case-insensitive; normalize as EmailStr did
+        local, domain = v.rsplit('@', 1)
+        return f"{local}@{domain.lower()}"
 
 class UserLogin(BaseModel):
     username: str
@@ -23,8 +39,7 @@ class UserResponse(BaseModel):
     email: str
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
@@ -40,19 +55,22 @@ class PollOptionResponse(BaseModel):
     position: int
     vote_count: int = 0
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PollCreate(BaseModel):
     title: str = Field(..., min_length=3, max_length=200)
     description: Optional[str] = Field(None, max_length=1000)
-    options: List[PollOptionCreate] = Field(..., min_items=2, max_items=10)
+    options: List[PollOptionCreate] = Field(..., min_length=2, max_length=10)
     
-    @validator('options')
+    @field_validator('options')
+    @classmethod
     def validate_unique_options(cls, v):
-        texts = [opt.text.lower().strip() for opt in v]
-        if len(texts) != len(set(texts)):
-            raise ValueError('Poll options must be unique')
+        seen = set()
+        for opt in v:
+            text = opt.text.strip().lower()
+            if text in seen:
+                raise ValueError('Poll options must be unique')
+            seen.add(text)
         return v
 
 class PollUpdate(BaseModel):
@@ -75,8 +93,7 @@ class PollResponse(BaseModel):
     user_liked: bool = False
     user_vote_option_id: Optional[int] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class VoteCreate(BaseModel):
     option_id: int
@@ -88,8 +105,7 @@ class VoteResponse(BaseModel):
     option_id: int
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class LikeResponse(BaseModel):
     id: int
@@ -97,8 +113,7 @@ class LikeResponse(BaseModel):
     poll_id: int
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PollListResponse(BaseModel):
     polls: List[PollResponse]
@@ -107,7 +122,43 @@ class PollListResponse(BaseModel):
     page_size: int
     total_pages: int
 
-class WebSocketMessage(BaseModel):
-    type: str  # 'vote', 'like', 'poll_created', 'poll_updated'
+# WebSocket payloads. The envelopes are emitted from byte templates in
+# websocket.py; these models define the wire format and serialize the data,
+# and tests/test_websocket.py validates every template against them.
+class VoteUpdateData(BaseModel):
+    total_votes: int
+    options: List[PollOptionResponse]
+
+class LikeUpdateData(BaseModel):
+    total_likes: int
+
+class VoteUpdateMessage(BaseModel):
+    type: Literal['vote_update']
+    poll_id: int
+    data: VoteUpdateData
+
+class LikeUpdateMessage(BaseModel):
+    type: Literal['like_update']
     poll_id: int
-    data: dict
\ No newline at end of file
+    data: LikeUpdateData
+
+class PollCreatedMessage(BaseModel):
+    type: Literal['poll_created']
+    data: PollResponse
+
+class PollUpdateMessage(BaseModel):
+    type: Literal['poll_update']
+    poll_id: int
+    data: PollResponse
+
+class PollDeletedMessage(BaseModel):
+    type: Literal['poll_deleted']
+    poll_id: int
+
+WebSocketMessage = Annotated[
+    Union[
+        VoteUpdateMessage, LikeUpdateMessage,
+        PollCreatedMessage, PollUpdateMessage, PollDeletedMessage
+    ],
+    Field(discriminator='type')
+]
\ No newline at end of file
@@ -0,0 +1,37 @@
+import auth
+from conftest import register
+
+
+def test_cached_user_survives_rolled_back_request(client):
+    headers = register(client, "rollback_user")
+    poll = client.post("/api/polls", headers=headers, json={
+        "title": "Rollback poll",
+        "options": [{"text": "a"}, {"text": "b"}]
+    })
+    assert poll.status_code == 201, poll.text
+    poll = poll.json()
+    
+    # Resolve the user on a request whose session then rolls back
+    auth._user_cache.clear()
+    response = client.post(
+        f"/api/polls/{poll['id']}/vote", headers=headers, json={"option_id": 999999}
+    )
+    assert response.status_code == 400
+    
+    # The following requests hit the cache populated by that request
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["username"] == "rollback_user"
+    
+    response = client.post(
+        f"/api/polls/{poll['id']}/vote", headers=headers,
+        json={"option_id": poll["options"][0]["id"]}
+    )
+    assert response.status_code == 200, response.text
+    
+    response = client.post("/api/polls", headers=headers, json={
+        "title": "Second poll",
+        "options": [{"text": "a"}, {"text": "b"}]
+    })
+    assert response.status_code == 201, response.text
+    assert response.json()["creator_username"] == "rollback_user"
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, text
+
+import database
+
+# Schema of the first release: no counter columns and no unique voter indexes
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, "
+    "email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, created_at DATETIME)",
+    "CREATE TABLE polls (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, description TEXT, "
+    "creator_id INTEGER NOT NULL REFERENCES users(id), created_at DATETIME, is_active BOOLEAN)",
+    "CREATE TABLE poll_options (id INTEGER PRIMARY KEY, poll_id INTEGER NOT NULL "
+    "REFERENCES polls(id), text VARCHAR NOT NULL, position INTEGER NOT NULL)",
+    "CREATE TABLE votes (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+    "poll_id INTEGER NOT NULL, option_id INTEGER NOT NULL, created_at DATETIME)",
+    "CREATE TABLE likes (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+    "poll_id INTEGER NOT NULL, created_at DATETIME)",
+]
+
+
+def test_migrate_removes_duplicate_votes_and_likes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users VALUES (1, 'u', 'u@example.com', 'x', NULL)"))
+        conn.execute(text("INSERT INTO polls VALUES (1, 'Poll', NULL, 1, NULL, 1)"))
+        conn.execute(text("INSERT INTO poll_options VALUES (1, 1, 'a', 0), (2, 1, 'b', 1)"))
+        # Duplicates left by the old check-then-insert race
+        conn.execute(text("INSERT INTO votes VALUES (1, 1, 1, 1, NULL), (2, 1, 1, 2, NULL)"))
+        conn.execute(text("INSERT INTO likes VALUES (1, 1, 1, NULL), (2, 1, 1, NULL)"))
+    
+    with engine.begin() as conn:
+        database._migrate(conn)
+    
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM votes")).scalars().all() == [1]
+        assert conn.execute(text("SELECT id FROM likes")).scalars().all() == [1]
+        assert conn.execute(
+            text("SELECT total_votes, total_likes FROM polls")
+        ).one() == (1, 1)
+        assert conn.execute(
+            text("SELECT vote_count FROM poll_options ORDER BY id")
+        ).scalars().all() == [1, 0]
+        indexes = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index'")
+        ).scalars().all()
+        assert "uq_vote_poll_user" in indexes and "uq_like_poll_user" in indexes
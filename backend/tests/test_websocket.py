@@ -0,0 +1,93 @@
+import asyncio
+import zlib
+from datetime import datetime
+
+import orjson
+import pytest
+from pydantic import TypeAdapter
+
+import websocket
+from schemas import (
+    LikeUpdateData, PollOptionResponse, PollResponse, VoteUpdateData, WebSocketMessage
+)
+
+
+class RecordingWebSocket:
+    client = "test"
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_bytes(self, payload: bytes):
+        self.sent.append(orjson.loads(payload))
+
+
+class RawWebSocket(RecordingWebSocket):
+    async def send_bytes(self, payload: bytes):
+        self.sent.append(payload)
+
+
+def test_broadcast_envelopes_match_message_models(monkeypatch):
+    monkeypatch.setattr(websocket, "manager", websocket.ConnectionManager())
+    option = PollOptionResponse(id=1, text="a", position=0, vote_count=1)
+    poll_json = PollResponse(
+        id=901, title="Schema poll", description=None, creator_id=1,
+        creator_username="alice", created_at=datetime.utcnow(), is_active=True,
+        options=[option], total_votes=1
+    ).model_dump_json().encode()
+    
+    async def run():
+        client = RawWebSocket()
+        await websocket.manager.connect(client)
+        websocket.manager.subscribe(client, 901)
+        websocket.manager.subscribe(client, websocket.CATALOG_CHANNEL)
+        
+        await websocket.broadcast_vote_update(
+            901, VoteUpdateData(total_votes=1, options=[option])
+        )
+        await websocket.broadcast_like_update(901, LikeUpdateData(total_likes=1))
+        await websocket.broadcast_poll_created(poll_json)
+        await websocket.broadcast_poll_updated(901, poll_json)
+        await websocket.broadcast_poll_deleted(901)
+        await asyncio.sleep(0.1)
+        websocket.manager.disconnect(client)
+        return client.sent
+    
+    adapter = TypeAdapter(WebSocketMessage)
+    messages = [
+        adapter.validate_json(zlib.decompress(raw) if raw[0] == 0x78 else raw)
+        for raw in asyncio.run(run())
+    ]
+    assert [m.type for m in messages] == [
+        "vote_update", "like_update", "poll_created", "poll_update", "poll_deleted"
+    ]
+
+
+def test_redis_catalog_updates_for_different_polls_both_arrive(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    import redis.asyncio as aioredis
+    
+    monkeypatch.setattr(aioredis, "from_url", lambda url: fakeredis.FakeRedis())
+    monkeypatch.setattr(websocket, "REDIS_URL", "redis://test")
+    monkeypatch.setattr(websocket, "manager", websocket.ConnectionManager())
+    
+    async def run():
+        await websocket.start_pubsub()
+        try:
+            client = RecordingWebSocket()
+            await websocket.manager.connect(client)
+            websocket.manager.subscribe(client, websocket.CATALOG_CHANNEL)
+            
+            await websocket.broadcast_poll_updated(5, b'{"id":5}')
+            await websocket.broadcast_poll_updated(7, b'{"id":7}')
+            await asyncio.sleep(0.2)
+            websocket.manager.disconnect(client)
+            return client.sent
+        finally:
+            await websocket.stop_pubsub()
+    
+    sent = asyncio.run(run())
+    assert [(m["type"], m["poll_id"]) for m in sent] == [("poll_update", 5), ("poll_update", 7)]
@@ -1,158 +1,361 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, Set
-import json
+from pydantic import TypeAdapter
+from typing import Dict, Hashable, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
 import logging
+import os
+import orjson
+import zlib
+
+from schemas import VoteUpdateData, LikeUpdateData
 
 logger = logging.getLogger(__name__)
 
+# Messages buffered per connection before it is treated as too slow
+OUTBOX_SIZE = 256
+# How long a writer waits after a coalescable update for more to arrive
+COALESCE_DELAY = 0.01
+# Pseudo poll_id clients subscribe to for poll created/updated/deleted events
+CATALOG_CHANNEL = 0
+# Broadcasts at least this large are zlib-compressed once before fan-out
+COMPRESS_MIN_SIZE = 512
+# Polls whose last vote/like broadcast is remembered
+VERSION_CACHE_SIZE = 1024
+# When set, broadcasts are published to Redis and every worker process
+# delivers them to its own sockets; unset, they stay in-process
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_CHANNEL_PREFIX = "quickpoll:"
+
+def _compress(payload: bytes) -> bytes:
+    """Deflate a broadcast payload once for all recipients
+
+    Small payloads are returned as-is, since compressing them saves little.
+    Clients tell the two apart by the first byte: JSON starts with '{' and
+    a zlib stream with 0x78.
+    """
+    if len(payload) < COMPRESS_MIN_SIZE:
+        return payload
+    return zlib.compress(payload, 1)
+
+class ClientConnection:
+    """Send-side state of one socket: its outbound queue and writer task"""
+    __slots__ = ("websocket", "outbox", "writer")
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+    
+    def enqueue(self, payload: bytes, key: Optional[Tuple[str, int]] = None) -> bool:
+        """Queue payload for sending; returns False if the outbox is full"""
+        try:
+            self.outbox.put_nowait((key, payload))
+        except asyncio.QueueFull:
+            return False
+        return True
+
 class ConnectionManager:
     def __init__(self):
-        # Map of poll_id to set of WebSocket connections
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-        # Map of WebSocket to set of poll_ids it's subscribed to
-        self.subscriptions: Dict[WebSocket, Set[int]] = {}
-        # Set of all connected WebSockets (for global broadcasts)
-        self.all_connections: Set[WebSocket] = set()
+        # Map of poll_id to its subscribers, keyed by WebSocket. Broadcasts
+        # read the ClientConnection values directly, with no per-recipient
+        # lookup. Dicts double as insertion-ordered sets throughout.
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        # Map of WebSocket to the poll_ids it's subscribed to
+        self.subscriptions: Dict[WebSocket, Dict[int, None]] = {}
+        # All connected WebSockets, with their send state
+        self.all_connections: Dict[WebSocket, ClientConnection] = {}
+        # In-flight closes of dropped clients; the loop holds tasks only weakly
+        self.closing: Set[asyncio.Task] = set()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.subscriptions[websocket] = set()
-        self.all_connections.add(websocket)
+        connection = ClientConnection(websocket)
+        self.subscriptions[websocket] = {}
+        self.all_connections[websocket] = connection
+        connection.writer = asyncio.create_task(self._drain(connection))
         logger.info(f"WebSocket connected: {websocket.client}")
     
+    async def _drain(self, connection: ClientConnection):
+        """Write queued payloads to one connection, in order
+
+        Queue items are (key, payload). Items with a key carry latest-value
+        state such as vote counts, so when several with the same key are
+        waiting only the newest is sent.
+        """
+        outbox = connection.outbox
+        while True:
+            key, payload = await outbox.get()
+            if key is not None:
+                # Give a burst of updates a moment to collect
+                await asyncio.sleep(COALESCE_DELAY)
+            
+            pending = {key if key is not None else 0: payload}
+            unkeyed = 1
+            while not outbox.empty():
+                key, payload = outbox.get_nowait()
+                if key is None:
+                    key, unkeyed = unkeyed, unkeyed + 1
+                else:
+                    pending.pop(key, None)
+                pending[key] = payload
+            
+            try:
+                for payload in pending.values():
+                    await connection.websocket.send_bytes(payload)
+            except Exception as e:
+                logger.error(f"Error sending to websocket: {e}")
+                self.disconnect(connection.websocket)
+                return
+    
+    def _drop_slow(self, websocket: WebSocket):
+        # Slow client: drop it rather than buffer without bound
+        logger.warning(f"WebSocket outbox full, disconnecting: {websocket.client}")
+        self.disconnect(websocket)
+        task = asyncio.create_task(self._close(websocket))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+    
     def disconnect(self, websocket: WebSocket):
-        # Remove from all poll subscriptions
-        if websocket in self.subscriptions:
-            poll_ids = self.subscriptions[websocket].copy()
-            for poll_id in poll_ids:
-                self.unsubscribe(websocket, poll_id)
-            del self.subscriptions[websocket]
+        # Remove from all poll subscriptions. The socket's own entry is popped
+        # whole, so each poll needs just one lookup and nothing is copied.
+        for poll_id in self.subscriptions.pop(websocket, ()):
+            connections = self.active_connections.get(poll_id)
+            if connections:
+                connections.pop(websocket, None)
+                if not connections:
+                    del self.active_connections[poll_id]
         
-        # Remove from all connections
-        self.all_connections.discard(websocket)
+        # Remove from all connections and stop its writer
+        connection = self.all_connections.pop(websocket, None)
+        if connection is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
         logger.info(f"WebSocket disconnected: {websocket.client}")
     
     def subscribe(self, websocket: WebSocket, poll_id: int):
-        if poll_id not in self.active_connections:
-            self.active_connections[poll_id] = set()
-        self.active_connections[poll_id].add(websocket)
-        
-        if websocket in self.subscriptions:
-            self.subscriptions[websocket].add(poll_id)
+        connection = self.all_connections.get(websocket)
+        if connection is None:
+            return
+        self.active_connections.setdefault(poll_id, {})[websocket] = connection
+        self.subscriptions[websocket][poll_id] = None
         logger.info(f"WebSocket subscribed to poll {poll_id}")
     
     def unsubscribe(self, websocket: WebSocket, poll_id: int):
         if poll_id in self.active_connections:
-            self.active_connections[poll_id].discard(websocket)
+            self.active_connections[poll_id].pop(websocket, None)
             if not self.active_connections[poll_id]:
                 del self.active_connections[poll_id]
         
         if websocket in self.subscriptions:
-            self.subscriptions[websocket].discard(poll_id)
+            self.subscriptions[websocket].pop(poll_id, None)
         logger.info(f"WebSocket unsubscribed from poll {poll_id}")
     
-    async def broadcast_to_poll(self, poll_id: int, message: dict):
-        """Broadcast message to all connections subscribed to a specific poll"""
-        if poll_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[poll_id].copy():
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to websocket: {e}")
-                    disconnected.add(connection)
-            
-            # Clean up disconnected websockets
-            for connection in disconnected:
-                self.disconnect(connection)
-    
-    async def broadcast_to_all(self, message: dict):
-        """Broadcast message to all connected clients"""
-        disconnected = set()
-        for connection in self.all_connections.copy():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to websocket: {e}")
-                disconnected.add(connection)
-        
-        # Clean up disconnected websockets
-        for connection in disconnected:
-            self.disconnect(connection)
+    async def broadcast_to_poll(self, poll_id: int, payload: bytes, coalesce_key: Optional[Tuple[str, int]] = None):
+        """Queue a pre-serialized message for all connections subscribed to a specific poll
+
+        Messages sharing a coalesce_key replace each other if still queued.
+        """
+        connections = self.active_connections.get(poll_id)
+        if connections:
+            payload = _compress(payload)
+            # Enqueueing never mutates the registry, so iterate it in place and
+            # only disconnect overflowing clients afterwards
+            slow = [c.websocket for c in connections.values() if not c.enqueue(payload, coalesce_key)]
+            for websocket in slow:
+                self._drop_slow(websocket)
     
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
-            self.disconnect(websocket)
+    async def send_personal_message(self, payload: bytes, websocket: WebSocket):
+        connection = self.all_connections.get(websocket)
+        if connection is not None and not connection.enqueue(payload):
+            self._drop_slow(websocket)
 
 manager = ConnectionManager()
 
+# Replies with no variable fields are encoded once at import
+PONG_PAYLOAD = orjson.dumps({"type": "pong"})
+
+# Broadcast envelopes, pre-encoded up to the data field. Each message is the
+# template (with poll_id filled in) + the serialized data + b'}'.
+_VOTE_TMPL = b'{"type":"vote_update","poll_id":%d,"data":'
+_LIKE_TMPL = b'{"type":"like_update","poll_id":%d,"data":'
+_CREATED_TMPL = b'{"type":"poll_created","data":'
+_UPDATED_TMPL = b'{"type":"poll_update","poll_id":%d,"data":'
+_DELETED_TMPL = b'{"type":"poll_deleted","poll_id":%d}'
+
+# dump_json returns bytes straight from pydantic-core's serializer
+_VOTE_DATA = TypeAdapter(VoteUpdateData)
+_LIKE_DATA = TypeAdapter(LikeUpdateData)
+
 async def handle_websocket_message(websocket: WebSocket, data: dict):
     """Handle incoming WebSocket messages"""
     message_type = data.get("type")
     
     if message_type == "subscribe":
         poll_id = data.get("poll_id")
-        if poll_id:
+        if poll_id is not None:
             manager.subscribe(websocket, poll_id)
-            await manager.send_personal_message({
+            await manager.send_personal_message(orjson.dumps({
                 "type": "subscribed",
                 "poll_id": poll_id
-            }, websocket)
+            }), websocket)
     
     elif message_type == "unsubscribe":
         poll_id = data.get("poll_id")
-        if poll_id:
+        if poll_id is not None:
             manager.unsubscribe(websocket, poll_id)
-            await manager.send_personal_message({
+            await manager.send_personal_message(orjson.dumps({
                 "type": "unsubscribed",
                 "poll_id": poll_id
-            }, websocket)
+            }), websocket)
     
     elif message_type == "ping":
-        await manager.send_personal_message({
-            "type": "pong"
-        }, websocket)
-
-async def broadcast_vote_update(poll_id: int, vote_data: dict):
-    """Broadcast vote update to all subscribers of a poll"""
-    await manager.broadcast_to_poll(poll_id, {
-        "type": "vote_update",
-        "poll_id": poll_id,
-        "data": vote_data
-    })
-
-async def broadcast_like_update(poll_id: int, like_data: dict):
-    """Broadcast like update to all subscribers of a poll"""
-    await manager.broadcast_to_poll(poll_id, {
-        "type": "like_update",
-        "poll_id": poll_id,
-        "data": like_data
-    })
-
-async def broadcast_poll_created(poll_data: dict):
-    """Broadcast new poll creation to all connected clients"""
-    logger.info(f"Broadcasting new poll creation: {poll_data.get('id')}")
-    await manager.broadcast_to_all({
-        "type": "poll_created",
-        "data": poll_data
-    })
-
-async def broadcast_poll_updated(poll_id: int, poll_data: dict):
-    """Broadcast poll update to all connected clients (not just subscribers)"""
-    logger.info(f"Broadcasting poll update: {poll_id}, is_active: {poll_data.get('is_active')}")
-    await manager.broadcast_to_all({
-        "type": "poll_update",
-        "poll_id": poll_id,
-        "data": poll_data
-    })
+        await manager.send_personal_message(PONG_PAYLOAD, websocket)
+
+# Version of the last broadcast per (message type, poll_id), in LRU order
+_broadcast_versions: "OrderedDict[Tuple[str, int], Hashable]" = OrderedDict()
+
+def _is_duplicate(key: Tuple[str, int], version: Hashable) -> bool:
+    """Return True if the last broadcast sent under key had this version
+
+    Never True in Redis mode: other workers publish too, so what this worker
+    last sent says nothing about what clients last received.
+    """
+    if _redis is not None:
+        return False
+    if key in _broadcast_versions and _broadcast_versions[key] == version:
+        _broadcast_versions.move_to_end(key)
+        return True
+    return False
+
+def _remember_version(key: Tuple[str, int], version: Hashable):
+    _broadcast_versions[key] = version
+    _broadcast_versions.move_to_end(key)
+    if len(_broadcast_versions) > VERSION_CACHE_SIZE:
+        _broadcast_versions.popitem(last=False)
+
+# Redis client and listener task, set by start_pubsub() when REDIS_URL is set
+_redis = None
+_redis_listener: Optional[asyncio.Task] = None
+
+async def _publish(poll_id: int, payload: bytes, coalesce_key: Optional[Tuple[str, int]] = None):
+    """Deliver a broadcast to a poll's subscribers in every worker
+
+    The coalesce key travels in the channel name, as
+    quickpoll:<poll_id>:<kind>:<key poll_id> (both key parts empty when
+    there is none), so listeners can rebuild it exactly. The key's poll_id
+    differs from the channel's for catalog events.
+    """
+    if _redis is None:
+        await manager.broadcast_to_poll(poll_id, payload, coalesce_key)
+        return
+    kind, key_id = coalesce_key if coalesce_key else ("", "")
+    try:
+        await _redis.publish(f"{REDIS_CHANNEL_PREFIX}{poll_id}:{kind}:{key_id}", payload)
+    except Exception as e:
+        # The change is already committed; a lost broadcast must not fail
+        # the request that made it
+        logger.error(f"Redis publish failed for poll {poll_id}: {e}")
+
+async def _listen(pubsub):
+    """Fan messages published by any worker out to this worker's sockets"""
+    try:
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    _, poll_id, kind, key_id = message["channel"].decode().split(":")
+                    await manager.broadcast_to_poll(
+                        int(poll_id), message["data"], (kind, int(key_id)) if kind else None
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # pubsub reconnects and resubscribes on the next read
+                logger.error(f"Redis listener error, retrying: {e}")
+                await asyncio.sleep(1)
+    finally:
+        await pubsub.aclose()
+
+async def start_pubsub():
+    """Connect to Redis and start this worker's listener, if REDIS_URL is set"""
+    global _redis, _redis_listener
+    if not REDIS_URL:
+        return
+    import redis.asyncio as aioredis
+    
+    _redis = aioredis.from_url(REDIS_URL)
+    pubsub = _redis.pubsub()
+    await pubsub.psubscribe(f"{REDIS_CHANNEL_PREFIX}*")
+    _redis_listener = asyncio.create_task(_listen(pubsub))
+    logger.info("Broadcasting through Redis pub/sub")
+
+async def stop_pubsub():
+    global _redis, _redis_listener
+    if _redis_listener is not None:
+        _redis_listener.cancel()
+        _redis_listener = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+async def broadcast_vote_update(poll_id: int, vote_data: VoteUpdateData):
+    """Broadcast vote update to all subscribers of a poll
+
+    Skipped when the option counts are unchanged since the last broadcast,
+    e.g. a user re-voting for the same option.
+    """
+    key = ("vote_update", poll_id)
+    version = tuple(opt.vote_count for opt in vote_data.options)
+    if _is_duplicate(key, version):
+        return
+    payload = _VOTE_TMPL % poll_id + _VOTE_DATA.dump_json(vote_data) + b'}'
+    _remember_version(key, version)
+    await _publish(poll_id, payload, coalesce_key=key)
+
+async def broadcast_like_update(poll_id: int, like_data: LikeUpdateData):
+    """Broadcast like update to all subscribers of a poll
+
+    Skipped when total_likes is unchanged since the last broadcast.
+    """
+    key = ("like_update", poll_id)
+    version = like_data.total_likes
+    if _is_duplicate(key, version):
+        return
+    payload = _LIKE_TMPL % poll_id + _LIKE_DATA.dump_json(like_data) + b'}'
+    _remember_version(key, version)
+    await _publish(poll_id, payload, coalesce_key=key)
+
+async def broadcast_poll_created(poll_json: bytes):
+    """Broadcast new poll creation to catalog subscribers
+
+    poll_json is the already-serialized poll, spliced into the envelope as-is.
+    """
+    logger.info("Broadcasting new poll creation")
+    await _publish(CATALOG_CHANNEL, _CREATED_TMPL + poll_json + b'}')
+
+async def broadcast_poll_updated(poll_id: int, poll_json: bytes):
+    """Broadcast poll update to the catalog channel (not just the poll's subscribers)
+
+    Each update carries the whole poll, so queued ones for the same poll
+    coalesce.
+    """
+    logger.info(f"Broadcasting poll update: {poll_id}")
+    await _publish(
+        CATALOG_CHANNEL,
+        _UPDATED_TMPL % poll_id + poll_json + b'}',
+        coalesce_key=("poll_update", poll_id)
+    )
 
 async def broadcast_poll_deleted(poll_id: int):
-    """Broadcast poll deletion to all connected clients"""
+    """Broadcast poll deletion to catalog subscribers"""
     logger.info(f"Broadcasting poll deletion: {poll_id}")
-    await manager.broadcast_to_all({
-        "type": "poll_deleted",
-        "poll_id": poll_id
-    })
\ No newline at end of file
+    _broadcast_versions.pop(("vote_update", poll_id), None)
+    _broadcast_versions.pop(("like_update", poll_id), None)
+    await _publish(CATALOG_CHANNEL, _DELETED_TMPL % poll_id)
\ No newline at end of file
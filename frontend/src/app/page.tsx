@@ -8,7 +8,7 @@ import { CreatePollDialog } from '@/components/CreatePollDialog';
 import { Plus, LogOut, LogIn, UserPlus, Loader2, ListFilter } from 'lucide-react';
 import { useAuthStore } from '@/store/authStore';
 import { Poll, pollAPI } from '@/lib/api';
-import { wsManager } from '@/lib/websocket';
+import { wsManager, CATALOG_CHANNEL } from '@/lib/websocket';
 
 export default function HomePage() {
   const router = useRouter();
@@ -28,6 +28,7 @@ export default function HomePage() {
   // WebSocket connection and event handlers
   useEffect(() => {
     wsManager.connect();
+    wsManager.subscribe(CATALOG_CHANNEL);
     
     const handlePollCreated = (message: any) => {
       const newPoll = message.data;
@@ -1,5 +1,21 @@
 type MessageHandler = (data: any) => void;
 
+const decoder = new TextDecoder();
+
+// Pseudo poll id carrying poll_created / poll_update / poll_deleted events
+export const CATALOG_CHANNEL = 0;
+
+// First byte of a zlib stream; uncompressed JSON frames start with '{'
+const ZLIB_HEADER = 0x78;
+
+// Large broadcasts arrive zlib-compressed in binary frames
+async function decodeFrame(data: string | ArrayBuffer): Promise<string> {
+  if (typeof data === 'string') return data;
+  if (new Uint8Array(data)[0] !== ZLIB_HEADER) return decoder.decode(data);
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Response(stream).text();
+}
+
 class WebSocketManager {
   private ws: WebSocket | null = null;
   private reconnectAttempts = 0;
@@ -8,6 +24,8 @@ class WebSocketManager {
   private handlers: Map<string, Set<MessageHandler>> = new Map();
   private subscribedPolls: Set<number> = new Set();
   private isConnecting = false;
+  // Decoding may be async, so frames are chained to keep them in order
+  private inbox: Promise<void> = Promise.resolve();
 
   connect() {
     if (this.ws?.readyState === WebSocket.OPEN || this.isConnecting) {
@@ -19,6 +37,8 @@ class WebSocketManager {
 
     try {
       this.ws = new WebSocket(WS_URL);
+      // Server broadcasts are sent as binary UTF-8 JSON frames
+      this.ws.binaryType = 'arraybuffer';
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -32,12 +52,12 @@ class WebSocketManager {
       };
 
       this.ws.onmessage = (event) => {
-        try {
-          const message = JSON.parse(event.data);
-          this.handleMessage(message);
-        } catch (error) {
-          console.error('Error parsing WebSocket message:', error);
-        }
+        this.inbox = this.inbox
+          .then(() => decodeFrame(event.data))
+          .then((text) => this.handleMessage(JSON.parse(text)))
+          .catch((error) => {
+            console.error('Error parsing WebSocket message:', error);
+          });
       };
 
       this.ws.onerror = (error) => {